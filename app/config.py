@@ -5,6 +5,10 @@ class Settings(BaseSettings):
     webhook_secret: str
     database_url: str = "sqlite+aiosqlite:///./data/app.db"
     log_level: str = "INFO"
+    # Statements slower than this go to the slow-query log with their query plan
+    slow_query_ms: float = 200.0
+    # Share of requests carrying "X-Profile: 1" that get a Server-Timing breakdown (0 disables it)
+    profile_sample_rate: float = 0.0
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
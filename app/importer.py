@@ -0,0 +1,304 @@
+"""Bulk import / replay of webhook archives.
+
+Usage: python -m app.importer ARCHIVE.jsonl[.gz] [options]
+
+Each line of the archive is one webhook, in either form:
+
+* ``{"body": "<raw request body>", "signature": "<X-Signature value>"}`` -
+  the body is checked against WEBHOOK_SECRET exactly like ``POST /webhook``
+* a bare payload object (``{"message_id": ..., "from": ...}``) - there is no
+  signature to check, so these are only accepted with ``--trusted``
+
+Lines are validated with ``WebhookPayload`` in a process pool and written in
+large batches through ``Storage.bulk_insert_messages``, so replaying an
+archive twice (or one that overlaps live traffic) never creates duplicates.
+After every committed batch the number of lines done, and the running totals,
+are saved to the checkpoint file. A re-run with the same checkpoint resumes
+from there and keeps counting from those totals.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from itertools import islice
+from typing import Iterator, Optional
+
+from pydantic import ValidationError
+
+from app.config import get_settings, Settings
+from app.models import WebhookPayload
+from app.storage import Storage, build_engine, check_bulk_insert_dialect, create_session_maker, init_db
+
+@dataclass
+class ImportStats:
+    lines: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    bad_signature: int = 0
+
+def open_archive(path: str):
+    # Binary, so a line that isn't valid UTF-8 is rejected on its own in
+    # validate_chunk instead of stopping the reader
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+def read_chunks(path: str, chunk_size: int, skip: int = 0) -> Iterator[list[bytes]]:
+    with open_archive(path) as f:
+        # Gzip can't seek, so resuming means reading past what's already done
+        for _ in islice(f, skip):
+            pass
+        while True:
+            chunk = list(islice(f, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+def validate_chunk(lines: list[bytes], secret: Optional[str]) -> tuple[list[tuple], int, int]:
+    """Runs in a worker process. ``secret`` is None for trusted archives.
+
+    Returns the valid rows plus the number of invalid lines and bad signatures.
+    A bad line is only ever counted, never raised, so it can't end the import.
+    Rows are plain tuples since they are pickled back to the parent."""
+    rows = []
+    invalid = 0
+    bad_signature = 0
+    key = secret.encode() if secret is not None else None
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            # UnicodeDecodeError / UnicodeEncodeError are ValueErrors too
+            record = json.loads(line.decode("utf-8"))
+            if isinstance(record, dict) and isinstance(record.get("body"), str):
+                body = record["body"]
+                body_bytes = body.encode("utf-8")
+                if key is not None:
+                    signature = record.get("signature")
+                    if not isinstance(signature, str):
+                        bad_signature += 1
+                        continue
+                    # Compare bytes: compare_digest rejects non-ASCII str
+                    expected = hmac.new(key, body_bytes, hashlib.sha256).hexdigest().encode()
+                    if not hmac.compare_digest(signature.encode("utf-8", "surrogatepass"), expected):
+                        bad_signature += 1
+                        continue
+                payload = WebhookPayload.model_validate_json(body_bytes)
+            elif key is not None:
+                # Bare payload, nothing to verify it against
+                bad_signature += 1
+                continue
+            else:
+                payload = WebhookPayload.model_validate(record)
+        except (ValueError, ValidationError):
+            invalid += 1
+            continue
+
+        rows.append((payload.message_id, payload.from_, payload.to, payload.ts, payload.text))
+
+    return rows, invalid, bad_signature
+
+def load_checkpoint(checkpoint_path: Optional[str], archive: str) -> ImportStats:
+    """Totals from earlier runs; ``lines`` is where to resume."""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return ImportStats()
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    if checkpoint["archive"] != os.path.abspath(archive):
+        raise ValueError(f"Checkpoint {checkpoint_path} belongs to {checkpoint['archive']}")
+    if "stats" not in checkpoint:
+        # Older checkpoints only recorded the line count
+        return ImportStats(lines=checkpoint["lines"])
+    return ImportStats(**checkpoint["stats"])
+
+def save_checkpoint(checkpoint_path: str, archive: str, stats: ImportStats):
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"archive": os.path.abspath(archive), "stats": asdict(stats)}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+def report(stats: ImportStats, start: float, start_lines: int = 0, done: bool = False):
+    elapsed = time.perf_counter() - start
+    # Rate only counts lines read by this run, not ones resumed past
+    rate = (stats.lines - start_lines) / elapsed if elapsed else 0.0
+    print(
+        f"{'done' if done else 'progress'}: lines={stats.lines} inserted={stats.inserted} "
+        f"duplicates={stats.duplicates} invalid={stats.invalid} bad_signature={stats.bad_signature} "
+        f"elapsed={elapsed:.1f}s rate={rate:,.0f} lines/s",
+        file=sys.stderr
+    )
+
+async def run_import(
+    archive: str,
+    settings: Settings,
+    *,
+    batch_size: int = 20000,
+    chunk_size: int = 2000,
+    workers: Optional[int] = None,
+    checkpoint_path: Optional[str] = None,
+    trusted: bool = False,
+    quiet: bool = False
+) -> ImportStats:
+    """Import ``archive`` into the configured database.
+
+    ``workers=0`` validates in this process instead of a pool. When resuming
+    from a checkpoint the returned stats are totals across all runs.
+
+    Configuration problems raise ValueError before any DB, pool or checkpoint
+    is touched."""
+    try:
+        # Reading a byte also catches a .gz that isn't actually gzip
+        with open_archive(archive) as f:
+            f.read(1)
+    except OSError as e:
+        raise ValueError(f"Cannot read archive {archive}: {e}") from e
+
+    if not trusted and not settings.webhook_secret:
+        raise ValueError("WEBHOOK_SECRET is required unless the archive is trusted")
+
+    secret = None if trusted else settings.webhook_secret
+    stats = load_checkpoint(checkpoint_path, archive)
+    resume_from = stats.lines
+    start = time.perf_counter()
+
+    engine = build_engine(settings)
+    try:
+        # Fail now rather than on the first write, after a whole batch is validated
+        check_bulk_insert_dialect(engine.dialect.name)
+    except ValueError:
+        await engine.dispose()
+        raise
+    session_maker = create_session_maker(engine)
+    await init_db(engine)
+
+    loop = asyncio.get_running_loop()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    max_in_flight = max(workers, 1) * 2
+
+    async def write(rows: list[tuple], lines_covered: int):
+        async with session_maker() as session:
+            inserted = await Storage(session).bulk_insert_messages([
+                {"message_id": r[0], "from_msisdn": r[1], "to_msisddn": r[2], "ts": r[3], "text": r[4]}
+                for r in rows
+            ])
+        stats.inserted += inserted
+        stats.duplicates += len(rows) - inserted
+        stats.lines += lines_covered
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, archive, stats)
+        if not quiet:
+            report(stats, start, resume_from)
+
+    try:
+        # Keep a bounded number of chunks validating ahead of the writer, so
+        # memory stays flat and the pool keeps busy while a batch commits.
+        in_flight = deque()
+        chunks = read_chunks(archive, chunk_size, skip=resume_from)
+        pending_rows: list[tuple] = []
+        pending_lines = 0
+
+        def submit_next() -> bool:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return False
+            if pool is None:
+                future = loop.create_future()
+                future.set_result(validate_chunk(chunk, secret))
+            else:
+                future = loop.run_in_executor(pool, validate_chunk, chunk, secret)
+            in_flight.append((future, len(chunk)))
+            return True
+
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+
+        while in_flight:
+            future, chunk_lines = in_flight.popleft()
+            rows, invalid, bad_signature = await future
+            submit_next()
+
+            pending_rows.extend(rows)
+            pending_lines += chunk_lines
+            stats.invalid += invalid
+            stats.bad_signature += bad_signature
+
+            if len(pending_rows) >= batch_size:
+                await write(pending_rows, pending_lines)
+                pending_rows, pending_lines = [], 0
+
+        if pending_lines:
+            await write(pending_rows, pending_lines)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        await engine.dispose()
+
+    if not quiet:
+        report(stats, start, resume_from, done=True)
+    return stats
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+def non_negative_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {value}")
+    return number
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.importer",
+        description="Bulk import a JSONL (optionally .gz) webhook archive into the messages DB."
+    )
+    parser.add_argument("archive", help="Path to a .jsonl or .jsonl.gz archive")
+    parser.add_argument("--batch-size", type=positive_int, default=20000, help="Rows per DB transaction (default: 20000)")
+    parser.add_argument("--chunk-size", type=positive_int, default=2000, help="Lines per validation task (default: 2000)")
+    parser.add_argument("--workers", type=non_negative_int, default=None, help="Validation processes, 0 to validate inline (default: CPU count)")
+    parser.add_argument("--checkpoint", help="Checkpoint file; resumes from it if it exists")
+    parser.add_argument("--trusted", action="store_true", help="Skip signature checks and accept bare payload lines")
+    parser.add_argument("--database-url", help="Override DATABASE_URL")
+    args = parser.parse_args(argv)
+
+    if args.trusted:
+        # The secret is never used for trusted archives, so don't require it
+        settings = Settings(webhook_secret="")
+    else:
+        settings = get_settings()
+    if args.database_url:
+        settings = settings.model_copy(update={"database_url": args.database_url})
+
+    try:
+        stats = asyncio.run(run_import(
+            args.archive,
+            settings,
+            batch_size=args.batch_size,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            checkpoint_path=args.checkpoint,
+            trusted=args.trusted
+        ))
+    except ValueError as e:
+        parser.error(str(e))
+    # Non-zero exit if anything was rejected (in this or an earlier resumed
+    # run), so scripted backfills notice
+    return 1 if stats.invalid or stats.bad_signature else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,6 +28,16 @@ class JSONFormatter(logging.Formatter):
             log_record["dup"] = record.dup
         if hasattr(record, "result"):
             log_record["result"] = record.result
+        if hasattr(record, "operation"):
+            log_record["operation"] = record.operation
+        if hasattr(record, "route"):
+            log_record["route"] = record.route
+        if hasattr(record, "statement_id"):
+            log_record["statement_id"] = record.statement_id
+        if hasattr(record, "statement"):
+            log_record["statement"] = record.statement
+        if hasattr(record, "plan"):
+            log_record["plan"] = record.plan
             
         return json.dumps(log_record)
 
@@ -1,19 +1,58 @@
-from prometheus_client import Counter, Histogram
-
-HTTP_REQUESTS_TOTAL = Counter(
-    "http_requests_total",
-    "Total number of HTTP requests",
-    ["path", "status"]
+from typing import Optional
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    GCCollector,
+    PlatformCollector,
+    ProcessCollector,
+    generate_latest,
+    CONTENT_TYPE_LATEST,
 )
 
-WEBHOOK_REQUESTS_TOTAL = Counter(
-    "webhook_requests_total",
-    "Total number of webhook processing outcomes",
-    ["result"]
-)
+class Metrics:
+    """Metric collectors bound to their own registry, so each app instance
+    (and each test) starts from a clean slate instead of sharing globals."""
 
-REQUEST_LATENCY = Histogram(
-    "request_latency_ms",
-    "Request latency in milliseconds",
-    buckets=[10, 50, 100, 200, 500, 1000]
-)
+    content_type = CONTENT_TYPE_LATEST
+
+    def __init__(self, registry: Optional[CollectorRegistry] = None):
+        self.registry = registry or CollectorRegistry()
+
+        # Same process/runtime metrics the default global registry exposes
+        ProcessCollector(registry=self.registry)
+        PlatformCollector(registry=self.registry)
+        GCCollector(registry=self.registry)
+
+        self.http_requests_total = Counter(
+            "http_requests_total",
+            "Total number of HTTP requests",
+            ["path", "status"],
+            registry=self.registry
+        )
+
+        self.webhook_requests_total = Counter(
+            "webhook_requests_total",
+            "Total number of webhook processing outcomes",
+            ["result"],
+            registry=self.registry
+        )
+
+        self.request_latency = Histogram(
+            "request_latency_ms",
+            "Request latency in milliseconds",
+            buckets=[10, 50, 100, 200, 500, 1000],
+            registry=self.registry
+        )
+
+        # "statement" is a fingerprint of the SQL text, see app.profiling
+        self.db_query_latency = Histogram(
+            "db_query_latency_ms",
+            "Database statement latency in milliseconds",
+            ["operation", "route", "statement"],
+            buckets=[1, 5, 10, 25, 50, 100, 250, 500, 1000],
+            registry=self.registry
+        )
+
+    def render(self) -> bytes:
+        return generate_latest(self.registry)
@@ -0,0 +1,174 @@
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import functools
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger("app.db")
+
+PROFILE_HEADER = "X-Profile"
+
+# Who issued the statement: the Storage method and the HTTP route it was called from
+current_operation: ContextVar[str] = ContextVar("current_operation", default="-")
+current_route: ContextVar[str] = ContextVar("current_route", default="-")
+# Only set for requests that were picked for profiling
+current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+class RequestProfile:
+    """Per-phase timings (ms) for a single profiled request."""
+
+    def __init__(self):
+        self.timings: dict[str, float] = {}
+        # Set by ProfiledRoute around the endpoint call
+        self.endpoint_start: Optional[float] = None
+        self.endpoint_end: Optional[float] = None
+
+    def add(self, phase: str, duration_ms: float):
+        self.timings[phase] = self.timings.get(phase, 0.0) + duration_ms
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{phase};dur={ms:.3f}" for phase, ms in self.timings.items())
+
+def should_profile(request, sample_rate: float) -> bool:
+    if sample_rate <= 0 or request.headers.get(PROFILE_HEADER) != "1":
+        return False
+    return random.random() < sample_rate
+
+def record_phase(phase: str, duration_ms: float):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add(phase, duration_ms)
+
+def operation(func):
+    """Tag every statement run inside a Storage method with the method's name."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_operation.set(func.__name__)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            current_operation.reset(token)
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    """Splits a profiled request's handler time into validation (body parsing,
+    pydantic and dependencies, minus HMAC), the endpoint itself, and
+    serialization of the return value."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The request handler looks up dependant.call per request, so wrapping
+        # it here is enough to see when the endpoint starts and returns.
+        # FastAPI decides whether to await or threadpool the endpoint from the
+        # original callable, so the wrapper has to keep its sync/async kind.
+        call = self.dependant.call
+
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def timed_call(**values):
+                profile = current_profile.get()
+                if profile is None:
+                    return await call(**values)
+                profile.endpoint_start = time.perf_counter()
+                try:
+                    return await call(**values)
+                finally:
+                    profile.endpoint_end = time.perf_counter()
+        else:
+            @functools.wraps(call)
+            def timed_call(**values):
+                # Runs in the threadpool, which carries over the request's context
+                profile = current_profile.get()
+                if profile is None:
+                    return call(**values)
+                profile.endpoint_start = time.perf_counter()
+                try:
+                    return call(**values)
+                finally:
+                    profile.endpoint_end = time.perf_counter()
+
+        self.dependant.call = timed_call
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request):
+            profile = current_profile.get()
+            if profile is None:
+                return await handler(request)
+            start = time.perf_counter()
+            response = await handler(request)
+            end = time.perf_counter()
+            if profile.endpoint_start is not None and profile.endpoint_end is not None:
+                before = (profile.endpoint_start - start) * 1000
+                profile.add("validation", max(before - profile.timings.get("hmac", 0.0), 0.0))
+                profile.add("serialization", (end - profile.endpoint_end) * 1000)
+            return response
+
+        return profiled_handler
+
+def _fingerprint(statement: str) -> str:
+    # Statements are parameterized, so the text is stable per query shape
+    return hashlib.sha1(statement.encode()).hexdigest()[:12]
+
+def _explain(conn, statement: str, parameters) -> Optional[list[str]]:
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    try:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return [str(row[-1]) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except Exception as e:
+        logger.debug(f"Could not explain slow query: {e}")
+        return None
+
+def instrument_engine(engine: AsyncEngine, metrics, slow_query_ms: float):
+    """Time every statement on ``engine``, feed the per-statement histogram and
+    log anything slower than ``slow_query_ms`` along with its query plan."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+        operation_name = current_operation.get()
+        route = current_route.get()
+        fingerprint = _fingerprint(statement)
+
+        metrics.db_query_latency.labels(
+            operation=operation_name, route=route, statement=fingerprint
+        ).observe(duration_ms)
+        record_phase("db", duration_ms)
+
+        if duration_ms >= slow_query_ms:
+            explainable = not executemany and not (context is not None and context.isddl)
+            logger.warning(
+                "Slow query",
+                extra={
+                    "operation": operation_name,
+                    "route": route,
+                    "statement_id": fingerprint,
+                    "statement": statement,
+                    "latency_ms": round(duration_ms, 2),
+                    "plan": _explain(conn, statement, parameters) if explainable else None,
+                }
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        # after_cursor_execute never fires for a failed statement
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
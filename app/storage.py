@@ -1,30 +1,59 @@
 from typing import Optional, List
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy import select, func, desc, text
-from app.config import get_settings
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+from sqlalchemy import select, func, desc
+from sqlalchemy.engine import make_url
+from app.config import Settings
 from app.models import Base, Message, WebhookPayload
+from app.profiling import operation
 
-settings = get_settings()
+def is_memory_sqlite(database_url: str) -> bool:
+    # "sqlite://", "sqlite+aiosqlite:///:memory:", ":memory:?cache=shared", ...
+    url = make_url(database_url)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
 
-engine = create_async_engine(settings.database_url, echo=False)
-AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+def build_engine(settings: Settings) -> AsyncEngine:
+    connect_args = {}
+    poolclass = None
+    if is_memory_sqlite(settings.database_url):
+        # An in-memory SQLite DB only lives as long as its connection, so every
+        # session has to share the same one.
+        from sqlalchemy.pool import StaticPool
+        connect_args = {"check_same_thread": False}
+        poolclass = StaticPool
 
-async def init_db():
+    return create_async_engine(
+        settings.database_url,
+        echo=False,
+        connect_args=connect_args,
+        poolclass=poolclass
+    )
+
+BULK_INSERT_DIALECTS = ("sqlite", "postgresql")
+
+def check_bulk_insert_dialect(dialect: str):
+    if dialect not in BULK_INSERT_DIALECTS:
+        raise ValueError(
+            f"Bulk insert needs ON CONFLICT DO NOTHING, only supported for "
+            f"{' and '.join(BULK_INSERT_DIALECTS)} databases, not {dialect}"
+        )
+
+def create_session_maker(engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+async def init_db(engine: AsyncEngine):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
-
 class Storage:
     def __init__(self, session: AsyncSession):
         self.session = session
 
+    @operation
     async def get_message(self, message_id: str) -> Optional[Message]:
         result = await self.session.execute(select(Message).where(Message.message_id == message_id))
         return result.scalar_one_or_none()
 
+    @operation
     async def create_message(self, payload: WebhookPayload) -> Message:
         message = Message(
             message_id=payload.message_id,
@@ -38,6 +67,34 @@ class Storage:
         await self.session.refresh(message)
         return message
 
+    @operation
+    async def bulk_insert_messages(self, rows: list[dict]) -> int:
+        """Insert ``rows`` (message table column values) in one transaction,
+        skipping message_ids that already exist. Returns how many were inserted."""
+        if not rows:
+            return 0
+
+        dialect = self.session.get_bind().dialect.name
+        check_bulk_insert_dialect(dialect)
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+
+        # Core insert (not ORM), batched into multi-row INSERTs. Rows skipped by
+        # ON CONFLICT return nothing, so counting RETURNING rows gives the number
+        # inserted; executemany rowcount isn't reliable across drivers.
+        query = (
+            insert(Message.__table__)
+            .on_conflict_do_nothing(index_elements=["message_id"])
+            .returning(Message.__table__.c.message_id)
+        )
+        result = await self.session.execute(query, rows)
+        inserted = len(result.all())
+        await self.session.commit()
+        return inserted
+
+    @operation
     async def get_messages(self, limit: int, offset: int, from_filter: Optional[str] = None, since_filter: Optional[str] = None, q_filter: Optional[str] = None) -> tuple[List[Message], int]:
         query = select(Message)
         
@@ -65,6 +122,7 @@ class Storage:
         result = await self.session.execute(query)
         return result.scalars().all(), total
 
+    @operation
     async def get_stats(self):
         total_messages = await self.session.scalar(select(func.count(Message.message_id)))
         senders_count = await self.session.scalar(select(func.count(func.distinct(Message.from_msisdn))))
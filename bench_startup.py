@@ -0,0 +1,69 @@
+"""Cold-start benchmark.
+
+Every sample runs in a fresh interpreter so nothing is cached between runs:
+
+* import  - ``import app.main``
+* startup - ``create_app()`` plus running the lifespan (settings, logging,
+            engine, metrics registry, schema creation) up to the first request
+
+Usage: python bench_startup.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+PROBE = """
+import asyncio, json, time
+t0 = time.perf_counter()
+from app.main import create_app
+t1 = time.perf_counter()
+
+async def start():
+    app = create_app()
+    async with app.router.lifespan_context(app):
+        pass
+
+asyncio.run(start())
+t2 = time.perf_counter()
+print(json.dumps({"import": (t1 - t0) * 1000, "startup": (t2 - t1) * 1000}))
+"""
+
+def run_once(env):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout
+    # Logging is set up during startup, so only the last line is ours
+    return json.loads(out.strip().splitlines()[-1])
+
+def summarize(name, values):
+    print(
+        f"{name:<8} median={statistics.median(values):7.1f}ms "
+        f"min={min(values):7.1f}ms max={max(values):7.1f}ms"
+    )
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            WEBHOOK_SECRET=os.environ.get("WEBHOOK_SECRET", "benchsecret"),
+            DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db",
+            LOG_LEVEL="WARNING",
+        )
+        # Warm the OS file cache so the first sample isn't an outlier
+        run_once(env)
+        samples = [run_once(env) for _ in range(RUNS)]
+
+    print(f"{RUNS} runs, {sys.executable}")
+    summarize("import", [s["import"] for s in samples])
+    summarize("startup", [s["startup"] for s in samples])
+    summarize("total", [s["import"] + s["startup"] for s in samples])
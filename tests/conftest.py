@@ -1,11 +1,8 @@
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy.pool import StaticPool
 
-from app.main import app, get_db, get_settings, Settings
-from app.models import Base
+from app.main import create_app, Settings
 
 # Use in-memory SQLite for testing
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
@@ -18,24 +15,6 @@ def event_loop():
     yield loop
     loop.close()
 
-@pytest_asyncio.fixture(scope="function")
-async def test_db():
-    engine = create_async_engine(
-        TEST_DATABASE_URL, 
-        connect_args={"check_same_thread": False}, 
-        poolclass=StaticPool
-    )
-    TestingSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
-    
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        
-    async with TestingSessionLocal() as session:
-        yield session
-        
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
-
 @pytest.fixture
 def override_settings():
     return Settings(
@@ -45,12 +24,13 @@ def override_settings():
     )
 
 @pytest_asyncio.fixture
-async def client(test_db, override_settings):
-    # Override dependencies
-    app.dependency_overrides[get_db] = lambda: test_db
-    app.dependency_overrides[get_settings] = lambda: override_settings
-    
+async def app(override_settings):
+    # Each test gets its own app, and with it a fresh in-memory DB and metrics registry
+    app = create_app(override_settings)
+    async with app.router.lifespan_context(app):
+        yield app
+
+@pytest_asyncio.fixture
+async def client(app):
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
-        
-    app.dependency_overrides.clear()
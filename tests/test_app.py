@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import text
+
+from app.main import create_app, Settings
+from app.storage import build_engine, create_session_maker, init_db
+
+def test_create_app_is_lazy(monkeypatch):
+    # No secret in the environment: building the app must not touch settings, DB or metrics
+    monkeypatch.delenv("WEBHOOK_SECRET", raising=False)
+    app = create_app()
+    assert app.state.settings is None
+    assert not hasattr(app.state, "engine")
+    assert not hasattr(app.state, "metrics")
+
+@pytest.mark.asyncio
+async def test_apps_are_isolated(app, client):
+    await client.get("/health/live")
+
+    other = create_app(Settings(webhook_secret="other", database_url="sqlite+aiosqlite:///:memory:"))
+    async with other.router.lifespan_context(other):
+        assert other.state.metrics.registry is not app.state.metrics.registry
+        assert other.state.engine is not app.state.engine
+        sample = other.state.metrics.registry.get_sample_value(
+            "http_requests_total", {"path": "/health/live", "status": "200"}
+        )
+        assert sample is None
+
+    sample = app.state.metrics.registry.get_sample_value(
+        "http_requests_total", {"path": "/health/live", "status": "200"}
+    )
+    assert sample == 1
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("database_url", [
+    "sqlite+aiosqlite://",
+    "sqlite+aiosqlite:///:memory:",
+    "sqlite+aiosqlite:///:memory:?cache=shared",
+])
+async def test_in_memory_engine_shares_one_db(database_url):
+    engine = build_engine(Settings(webhook_secret="x", database_url=database_url))
+    await init_db(engine)
+    session_maker = create_session_maker(engine)
+    try:
+        # Would fail with "no such table" if each session got its own empty DB
+        async with session_maker() as first, session_maker() as second:
+            await first.execute(text("INSERT INTO messages VALUES ('a', '+1', '+2', '2024-01-01', NULL, '2024-01-01')"))
+            await first.commit()
+            assert (await second.execute(text("SELECT count(*) FROM messages"))).scalar_one() == 1
+    finally:
+        await engine.dispose()
@@ -0,0 +1,237 @@
+import pytest
+import gzip
+import hmac
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+from sqlalchemy import create_engine, text
+
+from app.config import Settings
+from app.importer import run_import, main
+import app.importer
+from app.storage import Storage, build_engine
+
+WEBHOOK_SECRET = "testsecret"
+
+def make_payload(i: int) -> dict:
+    return {"message_id": f"bulk{i}", "from": f"+{100 + i % 3}", "to": "+999", "ts": "2024-01-01T10:00:00Z", "text": f"msg {i}"}
+
+def signed_line(payload: dict, secret: str = WEBHOOK_SECRET) -> str:
+    body = json.dumps(payload)
+    signature = hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()
+    return json.dumps({"body": body, "signature": signature})
+
+def write_archive(path, lines):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wt") as f:
+        f.write("\n".join(lines) + "\n")
+
+def count_messages(db_path) -> int:
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.connect() as conn:
+        count = conn.execute(text("SELECT count(*) FROM messages")).scalar_one()
+    engine.dispose()
+    return count
+
+@pytest.fixture
+def settings(tmp_path):
+    return Settings(webhook_secret=WEBHOOK_SECRET, database_url=f"sqlite+aiosqlite:///{tmp_path}/import.db")
+
+@pytest.mark.asyncio
+async def test_import_is_idempotent(tmp_path, settings):
+    archive = tmp_path / "archive.jsonl.gz"
+    # bulk3 appears twice in the archive
+    write_archive(archive, [signed_line(make_payload(i)) for i in range(10)] + [signed_line(make_payload(3))])
+
+    stats = await run_import(str(archive), settings, batch_size=4, chunk_size=3, workers=0, quiet=True)
+    assert stats.lines == 11
+    assert stats.inserted == 10
+    assert stats.duplicates == 1
+
+    stats = await run_import(str(archive), settings, batch_size=4, chunk_size=3, workers=0, quiet=True)
+    assert stats.inserted == 0
+    assert stats.duplicates == 11
+    assert count_messages(tmp_path / "import.db") == 10
+
+@pytest.mark.asyncio
+async def test_bulk_insert_rejects_unsupported_dialect():
+    bind = SimpleNamespace(dialect=SimpleNamespace(name="mysql"))
+    session = SimpleNamespace(get_bind=lambda: bind)
+
+    with pytest.raises(ValueError, match="not mysql"):
+        await Storage(session).bulk_insert_messages([{"message_id": "x"}])
+
+@pytest.mark.asyncio
+async def test_import_rejects_bad_lines(tmp_path, settings):
+    archive = tmp_path / "archive.jsonl"
+    write_archive(archive, [
+        signed_line(make_payload(1)),
+        signed_line(make_payload(2), secret="wrong"),
+        json.dumps(make_payload(3)),  # unsigned
+        signed_line({"message_id": "", "from": "bad", "to": "+999", "ts": "2024-01-01T10:00:00Z"}),
+        "not json",
+    ])
+
+    stats = await run_import(str(archive), settings, workers=0, quiet=True)
+    assert stats.inserted == 1
+    assert stats.bad_signature == 2
+    assert stats.invalid == 2
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers", [0, 1])
+async def test_import_survives_malformed_lines(tmp_path, settings, workers):
+    archive = tmp_path / "archive.jsonl"
+    body = json.dumps(make_payload(9))
+    lines = [
+        json.dumps({"body": body, "signature": 12345}),
+        json.dumps({"body": body, "signature": "sig\u00e9"}),
+        json.dumps({"body": body, "signature": ["not", "a", "string"]}),
+        json.dumps({"body": "\ud800", "signature": "abc"}),  # lone surrogate, can't be encoded
+        signed_line(make_payload(1)),
+    ]
+    with open(archive, "wb") as f:
+        f.write("\n".join(lines).encode() + b"\n")
+        f.write(b'{"body": "\xff\xfe"}\n')  # not valid UTF-8
+        f.write(signed_line(make_payload(2)).encode() + b"\n")
+
+    stats = await run_import(str(archive), settings, workers=workers, quiet=True)
+    assert stats.lines == 7
+    assert stats.inserted == 2
+    assert stats.bad_signature == 3
+    assert stats.invalid == 2
+
+@pytest.mark.asyncio
+async def test_trusted_import_skips_signatures(tmp_path, settings):
+    archive = tmp_path / "archive.jsonl"
+    write_archive(archive, [json.dumps(make_payload(1)), signed_line(make_payload(2), secret="wrong")])
+
+    stats = await run_import(str(archive), settings, workers=0, trusted=True, quiet=True)
+    assert stats.inserted == 2
+
+@pytest.mark.asyncio
+async def test_import_resumes_from_checkpoint(tmp_path, settings):
+    archive = tmp_path / "archive.jsonl"
+    checkpoint = tmp_path / "archive.checkpoint"
+    write_archive(archive, [signed_line(make_payload(i)) for i in range(5)])
+
+    stats = await run_import(str(archive), settings, workers=0, checkpoint_path=str(checkpoint), quiet=True)
+    assert stats.inserted == 5
+    assert json.loads(checkpoint.read_text())["stats"]["lines"] == 5
+
+    # Same archive with more lines appended: only the new ones are read
+    write_archive(archive, [signed_line(make_payload(i)) for i in range(8)])
+    stats = await run_import(str(archive), settings, workers=0, checkpoint_path=str(checkpoint), quiet=True)
+    assert stats.lines == 8
+    assert stats.inserted == 8
+    assert count_messages(tmp_path / "import.db") == 8
+
+def test_resumed_cli_still_fails_on_earlier_rejects(tmp_path):
+    archive = tmp_path / "archive.jsonl"
+    checkpoint = tmp_path / "archive.checkpoint"
+    args = [
+        str(archive), "--workers", "0", "--checkpoint", str(checkpoint),
+        "--database-url", f"sqlite+aiosqlite:///{tmp_path}/import.db"
+    ]
+    env = dict(os.environ, WEBHOOK_SECRET=WEBHOOK_SECRET)
+
+    write_archive(archive, [signed_line(make_payload(1)), "not json"])
+    assert run_cli(args, env).returncode == 1
+
+    # The resumed run only reads the new, valid line but still reports the earlier reject
+    write_archive(archive, [signed_line(make_payload(1)), "not json", signed_line(make_payload(2))])
+    result = run_cli(args, env)
+    assert result.returncode == 1
+    assert "done: lines=3 inserted=2 duplicates=0 invalid=1" in result.stderr
+
+def run_cli(args, env):
+    return subprocess.run(
+        [sys.executable, "-m", "app.importer", *args],
+        env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True
+    )
+
+def test_cli_with_process_pool(tmp_path):
+    archive = tmp_path / "archive.jsonl"
+    write_archive(archive, [signed_line(make_payload(i)) for i in range(50)])
+
+    result = run_cli(
+        [
+            str(archive), "--workers", "2", "--chunk-size", "7",
+            "--database-url", f"sqlite+aiosqlite:///{tmp_path}/import.db"
+        ],
+        env=dict(os.environ, WEBHOOK_SECRET=WEBHOOK_SECRET)
+    )
+    assert result.returncode == 0, result.stderr
+    assert "done: lines=50 inserted=50" in result.stderr
+    assert count_messages(tmp_path / "import.db") == 50
+
+def test_cli_trusted_without_secret(tmp_path):
+    archive = tmp_path / "archive.jsonl"
+    write_archive(archive, [json.dumps(make_payload(i)) for i in range(3)])
+    env = {k: v for k, v in os.environ.items() if k != "WEBHOOK_SECRET"}
+
+    result = run_cli(
+        [str(archive), "--trusted", "--workers", "0", "--database-url", f"sqlite+aiosqlite:///{tmp_path}/import.db"],
+        env=env
+    )
+    assert result.returncode == 0, result.stderr
+    assert count_messages(tmp_path / "import.db") == 3
+
+@pytest.mark.parametrize("option, value", [
+    ("--chunk-size", "0"),
+    ("--chunk-size", "-5"),
+    ("--batch-size", "0"),
+    ("--workers", "-1"),
+    ("--chunk-size", "abc"),
+])
+def test_cli_rejects_bad_sizes(tmp_path, capsys, option, value):
+    with pytest.raises(SystemExit) as exc:
+        main([str(tmp_path / "archive.jsonl"), option, value])
+    assert exc.value.code == 2
+    assert option in capsys.readouterr().err
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name, content", [
+    ("missing.jsonl", None),
+    ("not-gzip.jsonl.gz", b"plain text\n"),
+])
+async def test_unreadable_archive_fails_before_any_work(tmp_path, settings, name, content):
+    archive = tmp_path / name
+    if content is not None:
+        archive.write_bytes(content)
+    checkpoint = tmp_path / "archive.checkpoint"
+
+    with pytest.raises(ValueError, match="Cannot read archive"):
+        await run_import(str(archive), settings, workers=0, checkpoint_path=str(checkpoint), quiet=True)
+    assert not (tmp_path / "import.db").exists()
+    assert not checkpoint.exists()
+
+def test_cli_reports_missing_archive(tmp_path):
+    result = run_cli(
+        [str(tmp_path / "missing.jsonl"), "--database-url", f"sqlite+aiosqlite:///{tmp_path}/import.db"],
+        env=dict(os.environ, WEBHOOK_SECRET=WEBHOOK_SECRET)
+    )
+    assert result.returncode == 2
+    assert "Cannot read archive" in result.stderr
+    assert "Traceback" not in result.stderr
+    assert not (tmp_path / "import.db").exists()
+
+@pytest.mark.asyncio
+async def test_unsupported_dialect_fails_before_any_work(tmp_path, settings, monkeypatch):
+    archive = tmp_path / "archive.jsonl"
+    write_archive(archive, [signed_line(make_payload(1))])
+
+    def mysql_engine(settings):
+        engine = build_engine(settings)
+        engine.dialect.name = "mysql"
+        return engine
+
+    monkeypatch.setattr(app.importer, "build_engine", mysql_engine)
+    with pytest.raises(ValueError, match="not mysql"):
+        await run_import(str(archive), settings, workers=0, quiet=True)
+    assert not (tmp_path / "import.db").exists()
@@ -0,0 +1,103 @@
+import pytest
+import pytest_asyncio
+import hmac
+import hashlib
+import json
+import logging
+from fastapi import APIRouter
+from httpx import AsyncClient
+
+from app.main import create_app, Settings
+from app.profiling import PROFILE_HEADER, ProfiledRoute
+
+WEBHOOK_SECRET = "testsecret"
+
+def generate_signature(body: dict):
+    body_bytes = json.dumps(body).encode()
+    return hmac.new(WEBHOOK_SECRET.encode(), body_bytes, hashlib.sha256).hexdigest()
+
+PAYLOAD = {"message_id": "p1", "from": "+111", "to": "+999", "ts": "2024-01-01T10:00:00Z", "text": "Alpha"}
+
+@pytest_asyncio.fixture
+async def profiled_app():
+    # Every statement counts as slow and every X-Profile request is sampled
+    app = create_app(Settings(
+        webhook_secret=WEBHOOK_SECRET,
+        database_url="sqlite+aiosqlite:///:memory:",
+        slow_query_ms=0,
+        profile_sample_rate=1.0
+    ))
+    async with app.router.lifespan_context(app):
+        yield app
+
+@pytest_asyncio.fixture
+async def profiled_client(profiled_app):
+    async with AsyncClient(app=profiled_app, base_url="http://test") as ac:
+        yield ac
+
+@pytest.mark.asyncio
+async def test_statements_attributed_to_operation_and_route(app, client):
+    await client.post("/webhook", json=PAYLOAD, headers={"X-Signature": generate_signature(PAYLOAD)})
+    await client.get("/stats")
+
+    registry = app.state.metrics.registry
+    samples = [
+        s for metric in registry.collect() if metric.name == "db_query_latency_ms"
+        for s in metric.samples if s.name == "db_query_latency_ms_count"
+    ]
+    seen = {(s.labels["operation"], s.labels["route"]) for s in samples}
+    assert ("get_message", "/webhook") in seen
+    assert ("create_message", "/webhook") in seen
+    assert ("get_stats", "/stats") in seen
+    # count, distinct senders, min, max and top senders are separate statements
+    assert len({s.labels["statement"] for s in samples if s.labels["operation"] == "get_stats"}) == 5
+
+@pytest.mark.asyncio
+async def test_slow_query_log_includes_plan(profiled_client, caplog):
+    caplog.set_level(logging.WARNING, logger="app.db")
+    resp = await profiled_client.get("/messages", params={"from": "+111"})
+    assert resp.status_code == 200
+
+    slow = [r for r in caplog.records if r.name == "app.db" and r.getMessage() == "Slow query"]
+    assert {r.operation for r in slow} == {"get_messages"}
+    assert all(r.route == "/messages" for r in slow)
+    assert all(r.plan for r in slow)
+    assert any("SCAN" in line or "SEARCH" in line for r in slow for line in r.plan)
+
+@pytest.mark.asyncio
+async def test_profile_header_returns_server_timing(profiled_client):
+    resp = await profiled_client.post(
+        "/webhook", json=PAYLOAD,
+        headers={"X-Signature": generate_signature(PAYLOAD), PROFILE_HEADER: "1"}
+    )
+    assert resp.status_code == 200
+    phases = {entry.split(";")[0] for entry in resp.headers["Server-Timing"].split(", ")}
+    assert {"hmac", "validation", "db", "serialization", "total"} <= phases
+
+    resp = await profiled_client.get("/stats")
+    assert "Server-Timing" not in resp.headers
+
+@pytest.mark.asyncio
+async def test_profiling_disabled_by_default(client):
+    resp = await client.get("/stats", headers={PROFILE_HEADER: "1"})
+    assert resp.status_code == 200
+    assert "Server-Timing" not in resp.headers
+
+@pytest.mark.asyncio
+async def test_sync_endpoint_on_profiled_route(profiled_app):
+    sync_router = APIRouter(route_class=ProfiledRoute)
+
+    @sync_router.get("/sync")
+    def sync_endpoint():
+        return {"status": "ok"}
+
+    profiled_app.include_router(sync_router)
+    async with AsyncClient(app=profiled_app, base_url="http://test") as ac:
+        resp = await ac.get("/sync")
+        assert resp.status_code == 200
+        assert resp.json() == {"status": "ok"}
+
+        resp = await ac.get("/sync", headers={PROFILE_HEADER: "1"})
+        assert resp.status_code == 200
+        phases = {entry.split(";")[0] for entry in resp.headers["Server-Timing"].split(", ")}
+        assert {"validation", "serialization", "total"} <= phases